@@ -0,0 +1,286 @@
+# admission.py
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# query_string 的词法单元: 短语、正则、范围、括号、普通词; 字段前缀和 +/- 属于后面的单元
+_FIELD_PREFIX = r'[+\-!]?(?:[\w.*]+:)?'
+_TOKEN = re.compile(
+    r'(?P<space>\s+)'
+    r'|(?P<paren>[()])'
+    r'|(?P<phrase>' + _FIELD_PREFIX + r'"(?:\\.|[^"\\])*"?(?:~\d*)?(?:\^[\d.]+)?)'
+    r'|(?P<regexp>' + _FIELD_PREFIX + r'/(?:\\.|[^/\\])*/?)'
+    r'|(?P<range>' + _FIELD_PREFIX + r'[\[{][^\]}]*[\]}]?)'
+    r'|(?P<term>(?:\\.|[^\s()"/\\])+|\\)'
+)
+_BINARY_OPERATORS = {'AND', 'OR', '&&', '||'}
+_UNARY_OPERATORS = {'NOT', '!'}
+_OPERATORS = _BINARY_OPERATORS | _UNARY_OPERATORS
+# 正则中第一个元字符之前的部分是可以用来缩小范围的字面前缀
+_REGEXP_META = set('.?+*|{}[]()"\\#@&<>~')
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝; status 为 429 时带 Retry-After"""
+
+    def __init__(self, reason, status=429, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now):
+        """取一个令牌; 成功返回 0, 否则返回需要等待的秒数"""
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """每个客户端一个令牌桶, 只保留最近活跃的 max_clients 个"""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client_key):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[client_key] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client_key)
+            wait = bucket.try_acquire(now)
+        if wait:
+            raise AdmissionRejected('请求过于频繁, 请稍后再试', retry_after=wait)
+
+
+class ConcurrencyLimiter:
+    """限制同时发往 OpenSearch 的请求数, 超出时短暂排队, 队列满或等待超时直接拒绝"""
+
+    def __init__(self, max_in_flight, max_queue, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._rejected = 0
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    self._rejected += 1
+                    raise AdmissionRejected('服务繁忙, 请稍后再试', retry_after=self.queue_timeout)
+                self._waiting += 1
+            try:
+                acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self._rejected += 1
+                raise AdmissionRejected('服务繁忙, 请稍后再试', retry_after=self.queue_timeout)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'waiting': self._waiting,
+                'rejected': self._rejected
+            }
+
+
+def _tokenize(query):
+    """返回 [(类型, 文本)], 不包含空白"""
+    return [(match.lastgroup, match.group()) for match in _TOKEN.finditer(query) if match.lastgroup != 'space']
+
+
+def _split_field(term):
+    """把 [+-]field:value 拆成 ('[+-]field:', value)"""
+    sign = term[:len(term) - len(term.lstrip('+-!'))]
+    term = term[len(sign):]
+    prefix = ''
+    match = re.match(r'[\w.*]+:', term)
+    if match:
+        prefix = match.group()
+        term = term[len(prefix):]
+    return sign + prefix, term
+
+
+def _wildcard_position(value):
+    """第一个未转义的 * 或 ? 之前的字面字符数, 没有通配符时返回 None"""
+    literal = 0
+    i = 0
+    while i < len(value):
+        if value[i] == '\\':
+            i += 2
+        elif value[i] in '*?':
+            return literal
+        else:
+            i += 1
+        literal += 1
+    return None
+
+
+def _regexp_prefix(value):
+    """正则 /.../ 中第一个元字符之前的字面字符数"""
+    body = value.strip('/')
+    for i, char in enumerate(body):
+        if char in _REGEXP_META:
+            return i
+    return len(body)
+
+
+def _is_too_broad(kind, text, min_prefix):
+    """通配符或正则之前的字面字符少于 min_prefix 个时认为代价过高, 例如 *, a*, *abc, /.*炎/"""
+    if text in _OPERATORS:
+        return False
+    _, value = _split_field(text)
+    if kind == 'regexp':
+        return _regexp_prefix(value) < min_prefix
+    if kind != 'term':
+        # 短语和范围中的 * 不会展开成通配查询
+        return False
+    position = _wildcard_position(value)
+    return position is not None and position < min_prefix
+
+
+def _strip_wildcards(text):
+    """去掉词中所有未转义的通配符, 保留字段前缀和 +/-"""
+    prefix, value = _split_field(text)
+    stripped = re.sub(r'(\\.)|[*?]', lambda match: match.group(1) or '', value)
+    return prefix + stripped if stripped else None
+
+
+def _drop_dangling(tokens):
+    """去掉删词之后悬空的运算符和空括号, 例如 a AND AND b -> a AND b"""
+    changed = True
+    while changed:
+        changed = False
+        for i, (kind, text) in enumerate(tokens):
+            before = tokens[i - 1][1] if i > 0 else None
+            after = tokens[i + 1][1] if i + 1 < len(tokens) else None
+            if text in _BINARY_OPERATORS:
+                dangling = before in (None, '(') or before in _OPERATORS or \
+                    after in (None, ')') or after in _BINARY_OPERATORS
+            elif text in _UNARY_OPERATORS:
+                dangling = after in (None, ')') or after in _BINARY_OPERATORS
+            else:
+                dangling = text == '(' and after == ')'
+            if dangling:
+                del tokens[i:i + (2 if text == '(' else 1)]
+                changed = True
+                break
+    return tokens
+
+
+def _join_tokens(tokens):
+    parts = []
+    for i, (_, text) in enumerate(tokens):
+        if i > 0 and text != ')' and tokens[i - 1][1] != '(':
+            parts.append(' ')
+        parts.append(text)
+    return ''.join(parts)
+
+
+def check_query_string(query, policy='reject', min_prefix=2, max_length=256):
+    """估算 query_string 的代价, 返回可以执行的查询
+
+    policy 为 reject 时拒绝前导通配符、过宽的通配查询和没有字面前缀的正则; rewrite 时去掉
+    过宽的词中的通配符, 正则直接去掉, 括号和运算符保持不变, 全部去掉后仍然拒绝; allow 时不做检查.
+    """
+    if policy == 'allow':
+        return query
+    if len(query) > max_length:
+        raise AdmissionRejected(f'查询内容过长(最多 {max_length} 个字符)', status=400)
+    tokens = _tokenize(query)
+    broad = [text for kind, text in tokens if _is_too_broad(kind, text, min_prefix)]
+    if not broad:
+        return query
+    if policy == 'rewrite':
+        kept = []
+        for kind, text in tokens:
+            if _is_too_broad(kind, text, min_prefix):
+                text = _strip_wildcards(text) if kind == 'term' else None
+                if text is None:
+                    continue
+            kept.append((kind, text))
+        kept = _drop_dangling(kept)
+        if any(text not in _OPERATORS and kind != 'paren' for kind, text in kept):
+            rewritten = _join_tokens(kept)
+            logger.info(f"Rewrote broad query_string '{query}' -> '{rewritten}'")
+            return rewritten
+    raise AdmissionRejected(f'查询条件过宽, 通配符或正则前至少需要 {min_prefix} 个字符: {" ".join(broad)}', status=400)
+
+
+class AdmissionController:
+    """search() 的准入控制: 按客户端限速、查询代价检查和并发上限"""
+
+    def __init__(self, config):
+        self.enabled = config.get('enabled', True)
+        self.wildcard_policy = config.get('wildcard_policy', 'reject')
+        self.min_wildcard_prefix = config.get('min_wildcard_prefix', 2)
+        self.max_query_length = config.get('max_query_length', 256)
+        self.search_timeout = config.get('search_timeout', 15)
+        self.rate_limiter = RateLimiter(config.get('rate_per_client', 5), config.get('burst_per_client', 20))
+        self.concurrency = ConcurrencyLimiter(config.get('max_in_flight', 16), config.get('max_queue', 32),
+                                              config.get('queue_timeout', 2))
+
+    @property
+    def allow_leading_wildcard(self):
+        """没有检查前导通配符时, OpenSearch 也必须允许, 否则 *肺炎 这样的查询会直接报错"""
+        return not self.enabled or self.wildcard_policy == 'allow' or self.min_wildcard_prefix <= 0
+
+    def check_rate(self, client_key):
+        if self.enabled:
+            self.rate_limiter.check(client_key)
+
+    def check_query(self, query):
+        if not self.enabled or not query:
+            return query
+        return check_query_string(query, self.wildcard_policy, self.min_wildcard_prefix, self.max_query_length)
+
+    @contextmanager
+    def slot(self):
+        if not self.enabled:
+            yield
+            return
+        with self.concurrency.slot():
+            yield
+
+    def get_stats(self):
+        stats = self.concurrency.get_stats()
+        stats['enabled'] = self.enabled
+        return stats
@@ -8,11 +8,19 @@ import json # Keep json for logging/debugging
 from webdav_client import WebDavClient,OperationFailed
 import io 
 import time
+import math
+import requests
 
 # Import the new SettingsManager class
-from config import SettingsManager # Assuming the file is config.py
+from config import SettingsManager, SettingsLoadError # Assuming the file is config.py
 from db_manager import dataDesensManager
+from pdf_fetcher import CircuitBreaker, HedgedPdfReader, CircuitOpenError, PdfQueueTimeout
+from pdf_index import PdfPathIndex
+from search_client import create_opensearch_client, session_preference, last_served_node, get_node_stats
+from admission import AdmissionController, AdmissionRejected
+from suggest_index import SuggestionService
 DESENS_DB = "./data_desens.db"
+PDF_INDEX_DB = "./pdf_index.db"
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
@@ -44,46 +52,133 @@ logger = logging.getLogger(__name__) # Get logger after configuring handlers
 
 # --- Settings Management ---
 # Create an instance of the SettingsManager
+# 设置以只读快照的形式保存, 请求中通过 settings_manager.snapshot 读取, 不需要复制
 settings_manager = SettingsManager()
-
-# Get settings for initialization
-app_settings = settings_manager.get_all_settings()
+settings = settings_manager.snapshot
 
 # --- Apply loaded settings to application variables ---
-PDF_DIR = app_settings.get('localfile', {}).get('pdf_directory', '/default/pdf/path') # Use .get for safety
-INDEX_NAME = app_settings.get('opensearch', {}).get('index_name', 'medical_records') # Use .get for safety
-
-# Initialize OpenSearch client with loaded settings
-opensearch_client = None # Initialize as None
-opensearch_config = app_settings.get('opensearch', {})# Get WebDAV settings
+PDF_DIR = settings['localfile'].get('pdf_directory', '/default/pdf/path') # Use .get for safety
+INDEX_NAME = settings['opensearch'].get('index_name', 'medical_records') # Use .get for safety
+# 索引按住院号路由后(见 manage_index.py), 带住院号的查询只需要访问一个分片
+ROUTE_BY_HOSPITAL_ID = settings['opensearch'].get('route_by_hospital_id', False)
 
 # 初始化脱敏数据库
 data_desens_manager = dataDesensManager(DESENS_DB)
 
-try:
-    time.sleep(15) # 等待opensearch启动，在容器中启动的时候 opensearch 还没有启动，所以需要等待
-    opensearch_client = opensearchpy.OpenSearch(
-        hosts=opensearch_config['host'],
-        http_auth=(opensearch_config['user'], opensearch_config['password']),
-        use_ssl=False,
-        verify_certs=False, # Consider setting this to True in production with proper CA certs
-        ssl_assert_hostname=False,
-        ssl_show_warn=False, # Set to True in production for warnings
-        timeout=60,  # Increase timeout to 30 seconds
-        max_retries=3,  # Retry failed requests
-        retry_on_timeout=True
-    )
-    # Test connection
-    if not opensearch_client.ping():
+
+def _build_pdf_reader(webdav_config):
+    """WebDAV 读取: 熔断 + 本地镜像兜底"""
+    return HedgedPdfReader(CircuitBreaker(
+        failure_threshold=webdav_config.get('breaker_failure_threshold', 5),
+        reset_timeout=webdav_config.get('breaker_reset_timeout', 30)
+    ), queue_timeout=webdav_config.get('queue_timeout', 5))
+
+
+def _build_webdav_client(webdav_config):
+    """WebDAV 客户端及其连接池在各请求间复用, 只在 webdav 设置变化时重建"""
+    if not (webdav_config.get('enabled', False) and webdav_config.get('ip') and
+            webdav_config.get('user') and webdav_config.get('password')):
+        return None
+    return WebDavClient(host=webdav_config.get('ip'), username=webdav_config.get('user'),
+                        password=webdav_config.get('password'), protocol='http', port=webdav_config.get('port'),
+                        timeout=(webdav_config.get('connect_timeout'), webdav_config.get('read_timeout')))
+
+
+def _build_pdf_index(localfile_config):
+    """本地 PDF 的 文件名->路径 索引, 支持分层存放的目录结构"""
+    if not localfile_config.get('index_enabled', True) or not PDF_DIR or not os.path.isdir(PDF_DIR):
+        return None
+    index = PdfPathIndex(PDF_DIR, PDF_INDEX_DB)
+    index.start_background_refresh(localfile_config.get('index_refresh_interval', 300))
+    return index
+
+
+def _build_opensearch_client(opensearch_config):
+    """Initialize OpenSearch client with loaded settings"""
+    try:
+        # search() 的超时由准入控制的 search_timeout 决定, 超时后不再重试
+        client = create_opensearch_client(opensearch_config, retry_on_timeout=False)
+        # Test connection
+        if not client.ping():
             logger.error("Failed to connect to OpenSearch. Check settings.json and OpenSearch status.")
-            opensearch_client = None # Set to None if connection fails
-    else:
-            logger.info("Successfully connected to OpenSearch.")
-except Exception as e:
+            return None # Set to None if connection fails
+        logger.info("Successfully connected to OpenSearch.")
+        return client
+    except Exception as e:
         logger.error(f"Error initializing OpenSearch client: {e}")
-        opensearch_client = None # Set to None on initialization error
+        return None # Set to None on initialization error
 
 
+def _build_suggestion_service(suggest_config):
+    """患者名/住院号输入提示, 在后台从 OpenSearch 构建"""
+    if opensearch_client is None or not suggest_config.get('enabled', True):
+        return None
+    service = SuggestionService(
+        opensearch_client, INDEX_NAME, data_desens_manager,
+        mask_value=lambda value: '*' * get_display_width(value),
+        page_size=suggest_config.get('page_size', 1000)
+    )
+    service.start_background_refresh(suggest_config.get('refresh_interval', 600))
+    return service
+
+
+pdf_reader = _build_pdf_reader(settings['webdav'])
+webdav_client = _build_webdav_client(settings['webdav'])
+# 搜索的准入控制: 限速、查询代价检查和并发上限
+admission_controller = AdmissionController(settings['admission'])
+pdf_index = _build_pdf_index(settings['localfile'])
+
+time.sleep(int(os.environ.get("OPENSEARCH_STARTUP_WAIT", 15))) # 等待opensearch启动，在容器中启动的时候 opensearch 还没有启动，所以需要等待
+opensearch_client = _build_opensearch_client(settings['opensearch'])
+suggestion_service = _build_suggestion_service(settings['suggest'])
+
+
+def _on_settings_changed(old, new):
+    """settings.json 变化后只重建受影响的资源; 每次变化在每个 worker 中只执行一次"""
+    global PDF_DIR, INDEX_NAME, ROUTE_BY_HOSPITAL_ID
+    global opensearch_client, suggestion_service, pdf_reader, webdav_client, pdf_index, admission_controller
+    logger.info(f"Applying settings version {new.version}")
+
+    if old['webdav'] != new['webdav']:
+        # 旧的线程池和连接池在没有引用后自动释放, 正在进行的读取不受影响
+        pdf_reader = _build_pdf_reader(new['webdav'])
+        webdav_client = _build_webdav_client(new['webdav'])
+    if old['admission'] != new['admission']:
+        admission_controller = AdmissionController(new['admission'])
+    if old['localfile'] != new['localfile']:
+        PDF_DIR = new['localfile'].get('pdf_directory', '/default/pdf/path')
+        if pdf_index is not None:
+            pdf_index.stop()
+        pdf_index = _build_pdf_index(new['localfile'])
+
+    opensearch_changed = old['opensearch'] != new['opensearch']
+    if opensearch_changed:
+        INDEX_NAME = new['opensearch'].get('index_name', 'medical_records')
+        ROUTE_BY_HOSPITAL_ID = new['opensearch'].get('route_by_hospital_id', False)
+        opensearch_client = _build_opensearch_client(new['opensearch'])
+    if opensearch_changed or old['suggest'] != new['suggest']:
+        if suggestion_service is not None:
+            suggestion_service.stop()
+        suggestion_service = _build_suggestion_service(new['suggest'])
+
+
+settings_manager.subscribe(_on_settings_changed)
+
+
+@app.before_request
+def _refresh_settings():
+    # 其他 worker 修改了 settings.json 时在这里重新加载, 检查本身只是一次 stat
+    settings_manager.refresh_if_changed()
+
+
+# 分组模式可以折叠的字段
+GROUP_FIELDS = {
+    'file': '文件名称.keyword',
+    'hospital_id': '住院号.keyword'
+}
+# 分组模式下没有高亮片段的页返回的页首字符数
+GROUP_NO_MATCH_SIZE = 200
+
 # --- Routes ---
 
 # Render frontend page
@@ -109,9 +204,21 @@ def search():
 
     page = int(request.args.get('page', 1))
     size = int(request.args.get('size', 5))
+    # 分组模式: 每个文件(或住院号)只返回最相关的一页, 另附前 K 个命中页
+    group_by = request.args.get('group_by', '')
+    inner_hits_size = max(1, min(int(request.args.get('inner_hits', 3)), 10))
+
+    if group_by and group_by not in GROUP_FIELDS:
+        return jsonify({'error': f'group_by 只能是 {", ".join(GROUP_FIELDS)}'}), 400
 
     if not query and not hospital_id and not patient_name:
         return jsonify({'results': [], 'total': 0, 'page': page, 'size': size, 'total_pages': 0})
+
+    try:
+        admission_controller.check_rate(_client_key())
+        query = admission_controller.check_query(query)
+    except AdmissionRejected as e:
+        return _admission_rejected_response(e)
     
     from_idx = (page - 1) * size
     search_query = {
@@ -137,7 +244,8 @@ def search():
         search_query['query']['bool']['must'].append({
             "query_string": {
                 "default_field": "页内容",
-                "query": query
+                "query": query,
+                "allow_leading_wildcard": admission_controller.allow_leading_wildcard
             }
         })
     else: # 如果搜索文本为空，则搜索所有文件
@@ -187,62 +295,209 @@ def search():
             date_range_filter['range']['出院时间']['lte'] = discharge_date_end
         search_query['query']['bool']['filter'].append(date_range_filter)
 
+    if group_by:
+        # 高亮只在 inner_hits 中做, 每组的第一个 inner hit 就是最相关的页
+        highlight = search_query.pop('highlight')
+        # 查询没有命中 页内容 (例如 患者名:张三) 时也返回页首的一段文字, 外层命中不再带 页内容
+        highlight['fields']['页内容'] = {'no_match_size': GROUP_NO_MATCH_SIZE}
+        search_query['collapse'] = {
+            'field': GROUP_FIELDS[group_by],
+            'inner_hits': {
+                'name': 'top_pages',
+                'size': inner_hits_size,
+                '_source': ['页号'],
+                'highlight': highlight
+            }
+        }
+        search_query['aggs'] = {'group_count': {'cardinality': {'field': GROUP_FIELDS[group_by]}}}
+        if query:
+            # 显示的内容来自 top_pages 的高亮, 外层命中不需要整页的 页内容
+            search_query['_source'] = {'excludes': ['页内容']}
 
     logger.info(f"Searching with query: {json.dumps(search_query, indent=2, ensure_ascii=False)}")
 
-    try:
-        response = opensearch_client.search(
-            index=INDEX_NAME,
-            body=search_query
-        )
-        results = []
-
-        for hit in response['hits']['hits']:
-            highlight_text = hit.get('highlight', {}).get('页内容')
-            display_text = highlight_text[0] if highlight_text else hit['_source'].get('页内容', '')
-            hospital_id = hit['_source'].get('住院号')
-
-            # 对opensearch中返回的数据做脱敏处理
-            desensData = data_desens_manager.getDesensDataDict(hospital_id)
-            if isinstance(desensData, dict):
-                for value in desensData.values():
-                    if value in display_text:
-                        display_text = display_text.replace(value, '*' * get_display_width(value))
-
-            results.append({
-                'id': hit['_id'],
-                'patient': hit['_source'].get('患者名', ''),
-                'hospital_id': hit['_source'].get('住院号', ''),
-                'admission_date': hit['_source'].get('入院时间', ''),
-                'discharge_date': hit['_source'].get('出院时间', ''),
-                'doc_type': hit['_source'].get('文件类型', ''),
-                'filename': hit['_source'].get('文件名称', ''),
-                'page': hit['_source'].get('页号', 0),
-                'text': display_text
-            })
+    # 只带住院号路由, 查询只会访问该住院号所在的分片
+    routing = hospital_id if hospital_id and ROUTE_BY_HOSPITAL_ID else None
+    preference = _search_preference() if settings_manager.snapshot['opensearch'].get('session_preference', True) else None
 
+    try:
+        with admission_controller.slot():
+            response = opensearch_client.search(
+                index=INDEX_NAME,
+                body=search_query,
+                routing=routing,
+                preference=preference,
+                request_timeout=admission_controller.search_timeout
+            )
+        served_by = last_served_node()
         total = response['hits']['total']['value'] if isinstance(response['hits']['total'], dict) else response['hits']['total']
+
+        if group_by:
+            results = [_format_group(hit) for hit in response['hits']['hits']]
+            total_hits = total
+            total = response.get('aggregations', {}).get('group_count', {}).get('value', len(results))
+        else:
+            results = [_format_hit(hit) for hit in response['hits']['hits']]
         total_pages = (total + size - 1) // size
 
-        logger.info(f"Search successful. Found {total} results.")
-        return jsonify({
+        logger.info(f"Search successful. Found {total} results on {served_by}.")
+        result = {
             'results': results,
             'total': total,
             'page': page,
             'size': size,
-            'total_pages': total_pages
-        })
+            'total_pages': total_pages,
+            'node': served_by
+        }
+        if group_by:
+            result['total_hits'] = total_hits
+        return jsonify(result)
+    except AdmissionRejected as e:
+        return _admission_rejected_response(e)
     except opensearchpy.exceptions.NotFoundError:
          logger.error(f"Index '{INDEX_NAME}' not found.")
          return jsonify({'error': f"Index '{INDEX_NAME}' not found. Please check settings.json and OpenSearch status."}), 404
+    except opensearchpy.exceptions.ConnectionTimeout as e:
+        logger.warning(f"OpenSearch search timed out after {admission_controller.search_timeout}s: {e}")
+        return jsonify({'error': '搜索超时, 请缩小查询范围后重试'}), 504
+    except opensearchpy.exceptions.ConnectionError as e:
+        logger.error(f"OpenSearch unavailable during search: {e}")
+        return jsonify({'error': 'OpenSearch 暂不可用, 请稍后再试'}), 503
     except Exception as e:
         logger.error(f"Error during OpenSearch search: {str(e)}", exc_info=True)
         return jsonify({'error': f'搜索失败: {str(e)}'}), 500
 
 
+def _mask_text(text, desens_data):
+    """对opensearch中返回的数据做脱敏处理"""
+    if isinstance(desens_data, dict):
+        for value in desens_data.values():
+            if value in text:
+                text = text.replace(value, '*' * get_display_width(value))
+    return text
+
+
+def _hit_fields(hit):
+    return {
+        'id': hit['_id'],
+        'patient': hit['_source'].get('患者名', ''),
+        'hospital_id': hit['_source'].get('住院号', ''),
+        'admission_date': hit['_source'].get('入院时间', ''),
+        'discharge_date': hit['_source'].get('出院时间', ''),
+        'doc_type': hit['_source'].get('文件类型', ''),
+        'filename': hit['_source'].get('文件名称', ''),
+        'page': hit['_source'].get('页号', 0)
+    }
+
+
+def _format_hit(hit):
+    highlight_text = hit.get('highlight', {}).get('页内容')
+    display_text = highlight_text[0] if highlight_text else hit['_source'].get('页内容', '')
+    desens_data = data_desens_manager.getDesensDataDict(hit['_source'].get('住院号'))
+
+    result = _hit_fields(hit)
+    result['text'] = _mask_text(display_text, desens_data)
+    return result
+
+
+def _format_group(hit):
+    """分组结果: 最相关的一页, 加上该组命中的页数和前 K 个命中页的高亮"""
+    inner = hit.get('inner_hits', {}).get('top_pages', {}).get('hits', {})
+    inner_total = inner.get('total', 0)
+    match_count = inner_total['value'] if isinstance(inner_total, dict) else inner_total
+    # 同一组只查询一次脱敏数据
+    desens_data = data_desens_manager.getDesensDataDict(hit['_source'].get('住院号'))
+
+    pages = []
+    for inner_hit in inner.get('hits', []):
+        highlight_text = inner_hit.get('highlight', {}).get('页内容')
+        pages.append({
+            'id': inner_hit['_id'],
+            'page': inner_hit.get('_source', {}).get('页号', 0),
+            'text': _mask_text(highlight_text[0], desens_data) if highlight_text else ''
+        })
+
+    result = _hit_fields(hit)
+    if pages and pages[0]['text']:
+        result['text'] = pages[0]['text']
+    else:
+        result['text'] = _mask_text(hit['_source'].get('页内容', ''), desens_data)
+    result['match_count'] = match_count
+    result['pages'] = pages
+    return result
+
+
+def _client_key():
+    """限速使用的客户端标识; 部署在反向代理后面时可以信任 X-Forwarded-For
+
+    trust_forwarded_for 为 true 或代理层数 N 时, 使用从右数第 N 个条目, 即自己的代理追加的客户端地址;
+    更左边的条目由客户端自己填写, 不能用来限速.
+    """
+    hops = int(settings_manager.snapshot['admission'].get('trust_forwarded_for', False) or 0)
+    if hops > 0 and 'X-Forwarded-For' in request.headers:
+        route = request.access_route
+        if len(route) >= hops:
+            return route[-hops]
+    return request.remote_addr
+
+
+def _admission_rejected_response(e):
+    logger.warning(f"Search rejected for {_client_key()}: {e.reason}")
+    response = jsonify({'error': e.reason})
+    if e.status == 429:
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, e.status
+
+
+@app.route('/api/admission_stats', methods=['GET'])
+def get_admission_stats():
+    """Returns in-flight queue state and rejection counters for search()."""
+    return jsonify(admission_controller.get_stats())
+
+
+def _search_preference():
+    """按会话生成 preference; 前端可以通过 X-Session-Id 传入会话标识"""
+    session_key = request.headers.get('X-Session-Id') or \
+        f"{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+    return session_preference(session_key)
+
+
+@app.route('/api/opensearch_nodes', methods=['GET'])
+def get_opensearch_nodes():
+    """Returns the nodes in the connection pool and how many requests each served."""
+    if opensearch_client is None:
+        return jsonify({'error': 'OpenSearch client not initialized or connected. Check server logs and settings.json.'}), 500
+    return jsonify(get_node_stats(opensearch_client))
+
+
+# Suggest API
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """Returns prefix completions for 患者名 (field=patient) or 住院号 (field=hospital_id)."""
+    if suggestion_service is None:
+        return jsonify({'error': '输入提示未启用或 OpenSearch 未连接'}), 503
+
+    field = request.args.get('field', 'patient')
+    prefix = request.args.get('prefix', '').strip()
+    size = min(int(request.args.get('size', 10)), 50)
+    if field not in SuggestionService.FIELDS:
+        return jsonify({'error': f'field 只能是 {", ".join(SuggestionService.FIELDS)}'}), 400
+    if not prefix:
+        return jsonify({'suggestions': []})
+    return jsonify({'suggestions': suggestion_service.suggest(field, prefix, size)})
+
+
+@app.route('/api/suggest_stats', methods=['GET'])
+def get_suggest_stats():
+    """Returns the size and last refresh time of the suggestion index."""
+    if suggestion_service is None:
+        return jsonify({'error': '输入提示未启用或 OpenSearch 未连接'}), 503
+    return jsonify(suggestion_service.get_stats())
+
+
 # 通过文件名来获取路径（特殊处理）
 def parsefilename(filename) -> str:
-    if not app_settings.get('others', {}).get('specialpath', False) :
+    if not settings_manager.snapshot['others'].get('specialpath', False) :
          return filename
     # 提取第一个'_'前的数字
     first_part = filename.split('_')[0]
@@ -262,17 +517,14 @@ def get_pdf():
          logger.warning("PDF request received without filename.")
          return jsonify({'error': '文件名不能为空'}), 400
 
-    #webdav有可能在运行中被修改,所以每次都要加载一下设置
-    webdav_settings = settings_manager.get_webdav_settings()
-    webdav_enabled = webdav_settings.get('enabled', False)
+    #webdav有可能在运行中被修改, 使用当前版本的设置快照和对应的客户端
+    webdav_settings = settings_manager.snapshot['webdav']
+    webdav = webdav_client
     webdav_ip = webdav_settings.get('ip')
-    webdav_user = webdav_settings.get('user')
-    webdav_port = webdav_settings.get('port')
-    webdav_password = webdav_settings.get('password')
     webdav_directory = webdav_settings.get('directory', '/') # Default to root if not specified
 
     # --- WebDAV 有效性判断 ---
-    if webdav_enabled and webdav_ip and webdav_user and webdav_password:
+    if webdav is not None:
 
         # 特殊处理,只针对目录名是由文件名称组成的情况
         # filename = parsefilename(filename)
@@ -286,19 +538,35 @@ def get_pdf():
 
 
         logger.debug(f"Attempting WebDAV download from {webdav_ip} path {path_for_client}")
-        try:
-            # Connect to the WebDAV server
-            webdav = WebDavClient(host=webdav_ip, username=webdav_user, password=webdav_password,protocol='http', port=webdav_port)
+
+        def fetch_from_webdav():
             byte_stream = io.BytesIO()
             webdav.download(path_for_client, byte_stream)
             byte_stream.seek(0)  # Rewind the stream for reading
+            return byte_stream
 
-            logger.info(f"Successfully fetched '{filename}' from WebDAV.")
+        try:
+            source, byte_stream = pdf_reader.read(
+                fetch_from_webdav,
+                local_path=_local_pdf_path(filename),
+                hedge=webdav_settings.get('hedge_enabled', False),
+                is_failure=_is_webdav_outage
+            )
+            logger.info(f"Successfully fetched '{filename}' from {source}.")
             return send_file(byte_stream, mimetype='application/pdf',download_name=filename)
 
         except OperationFailed as e:
             logger.error(f" webdav 失败'{e.reason}'  {webdav_ip} path {path_for_client}")
             return jsonify({'error': f'WebDAV: {filename}'}), 404
+        except CircuitOpenError:
+            logger.warning(f"WebDAV circuit open and no local mirror for '{filename}'")
+            return jsonify({'error': f'WebDAV 暂不可用: {filename}'}), 503
+        except PdfQueueTimeout:
+            logger.warning(f"WebDAV read queue full and no local mirror for '{filename}'")
+            return jsonify({'error': f'WebDAV 繁忙: {filename}'}), 503
+        except requests.exceptions.Timeout as e:
+            logger.error(f"WebDAV timeout fetching '{filename}': {e}")
+            return jsonify({'error': f'WebDAV 超时: {filename}'}), 504
         except Exception as e:
             logger.error(f"Unexpected error during WebDAV fetch of '{filename}': {e}", exc_info=True)
             return jsonify({'error': f'从WebDAV获取文件时发生未知错误: {str(e)}'}), 500
@@ -309,19 +577,47 @@ def get_pdf():
          logger.error("没有发现本地路径")
          return jsonify({'error': 'PDF目录未配置或不存在。请检查settings.json'}), 500
 
-    # 预防路径遍历攻击
-    filename = os.path.basename(filename)
-    file_path = os.path.join(PDF_DIR, filename)
+    file_path = _local_pdf_path(filename)
 
-    if os.path.exists(file_path) and os.path.isfile(file_path):
+    if file_path is not None:
         logger.info(f"Serving local PDF file: {file_path}")
         return send_file(file_path, mimetype='application/pdf')
 
     # If neither WebDAV (if enabled) nor local file is found
-    logger.warning(f"Local PDF file not found: {file_path}")
+    logger.warning(f"Local PDF file not found: {filename}")
     return jsonify({'error': 'PDF not found'}), 404
 
 
+def _local_pdf_path(filename):
+    """返回本地(镜像)目录中的 PDF 路径, 不存在时返回 None"""
+    if not PDF_DIR or not os.path.isdir(PDF_DIR):
+        return None
+    # 预防路径遍历攻击: 只使用文件名部分查找
+    filename = os.path.basename(filename)
+    if pdf_index is not None:
+        file_path = pdf_index.resolve(filename)
+        if file_path is not None:
+            return file_path
+    # 索引中没有(例如刚加入还未刷新), 按平铺和分层两种布局直接查找
+    root_dir = os.path.realpath(PDF_DIR)
+    for candidate in (filename, parsefilename(filename)):
+        file_path = os.path.realpath(os.path.join(root_dir, candidate))
+        if file_path.startswith(root_dir + os.sep) and os.path.isfile(file_path):
+            return file_path
+    return None
+
+
+def _is_webdav_outage(e):
+    """文件不存在(404)不代表 WebDAV 故障, 不计入熔断"""
+    return not (isinstance(e, OperationFailed) and e.actual_code == 404)
+
+
+@app.route('/api/webdav_stats', methods=['GET'])
+def get_webdav_stats():
+    """Returns circuit breaker state and local fallback counters."""
+    return jsonify(pdf_reader.get_stats())
+
+
 # Get File Types API
 @app.route('/api/file_types', methods=['GET'])
 def get_file_types():
@@ -379,6 +675,9 @@ def save_webdav_settings():
              return jsonify({'error': '保存设置失败: 数据格式错误。'}), 400
 
 
+    except SettingsLoadError as e:
+        logger.error(f"WebDAV settings not saved: {e}")
+        return jsonify({'error': '保存设置失败: settings.json 无法读取, 请先修复该文件。'}), 409
     except Exception as e:
         logger.error(f"Error saving WebDAV settings via API: {str(e)}", exc_info=True)
         return jsonify({'error': f'保存设置失败: {str(e)}'}), 500
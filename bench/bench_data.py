@@ -0,0 +1,54 @@
+# bench_data.py
+"""压测用的合成数据: 患者列表、页内容和脱敏数据库, 同一个 seed 生成的数据完全相同"""
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_manager import dataDesensManager  # noqa: E402
+
+SURNAMES = '赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜'
+GIVEN_NAMES = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰'
+PHRASES = ['患者主诉发热咳嗽三天', '既往体健否认高血压病史', '查体神志清楚双肺呼吸音粗',
+           '诊断为社区获得性肺炎', '予以抗感染对症支持治疗', '出院时一般情况良好']
+
+
+def make_patients(count, seed=42):
+    """返回 [(住院号, 患者名)]"""
+    rng = random.Random(seed)
+    return [(f'H{i:06d}', rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2))))
+            for i in range(count)]
+
+
+def make_page_text(patient_name, size, seed=0):
+    """生成大约 size 个字符的页内容, 其中包含患者名, 用于测试脱敏替换"""
+    rng = random.Random(seed)
+    parts = [f'患者{patient_name}']
+    length = len(parts[0])
+    while length < size:
+        phrase = rng.choice(PHRASES)
+        parts.append(phrase)
+        length += len(phrase)
+    return '，'.join(parts)[:max(size, len(parts[0]))]
+
+
+def make_pdf(size):
+    """生成 size 字节左右的合成 PDF (只保证文件头尾合法, 内容用注释填充)"""
+    header = b'%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n' \
+             b'2 0 obj << /Type /Pages /Kids [] /Count 0 >> endobj\n'
+    trailer = b'trailer << /Root 1 0 R >>\n%%EOF\n'
+    padding = max(0, size - len(header) - len(trailer))
+    line = b'%' + b'x' * 78 + b'\n'
+    body = line * (padding // len(line)) + b'%' * (padding % len(line))
+    return header + body + trailer
+
+
+def seed_desens_db(db_path, patients, every=10):
+    """每 every 个患者写入一条脱敏数据 (患者名), 其余患者不脱敏"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    manager = dataDesensManager(db_path)
+    for hospital_id, name in patients[::every]:
+        manager.addDesensData(hospital_id, json.dumps({'name': name, 'age': ''}, ensure_ascii=False))
+    return manager
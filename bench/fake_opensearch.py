@@ -0,0 +1,153 @@
+# fake_opensearch.py
+"""返回固定结果的 OpenSearch 替身, 只实现 app.py 用到的接口"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_data import make_patients, make_page_text
+
+
+class FakeOpenSearch:
+    def __init__(self, patients, hits_per_page=10, text_size=500, total=10000, latency_ms=0):
+        self.patients = patients
+        self.hits_per_page = hits_per_page
+        self.total = total
+        self.latency = latency_ms / 1000.0
+        # 预先生成所有页, 请求时只做拼装
+        self.sources = []
+        for i in range(hits_per_page):
+            hospital_id, name = patients[i % len(patients)]
+            self.sources.append({
+                '患者名': name,
+                '住院号': hospital_id,
+                '入院时间': '2024-01-01',
+                '出院时间': '2024-01-10',
+                '文件类型': '出院记录',
+                '文件名称': f'{hospital_id}_{i}.pdf',
+                '页号': str(i + 1),
+                '页内容': make_page_text(name, text_size, seed=i)
+            })
+
+    def _hit(self, i, body):
+        source = self.sources[i % len(self.sources)]
+        hit = {'_index': 'medical_records', '_id': f'doc-{i}', '_score': 1.0, '_source': source}
+        if 'highlight' in body:
+            hit['highlight'] = {'页内容': [source['页内容'][:200]]}
+        collapse = body.get('collapse')
+        if collapse:
+            inner = collapse.get('inner_hits', {})
+            hit['inner_hits'] = {inner.get('name', 'inner'): {'hits': {
+                'total': {'value': 40, 'relation': 'eq'},
+                'hits': [{'_id': f'doc-{i}-{k}', '_source': {'页号': str(k + 1)},
+                          'highlight': {'页内容': [source['页内容'][:200]]}}
+                         for k in range(inner.get('size', 3))]
+            }}}
+        return hit
+
+    def _aggregations(self, aggs):
+        result = {}
+        for name, agg in aggs.items():
+            if 'composite' in agg:
+                # 输入提示: 一页返回所有患者
+                if agg['composite'].get('after'):
+                    result[name] = {'buckets': []}
+                else:
+                    result[name] = {
+                        'buckets': [{'key': {'hospital_id': hospital_id, 'patient': patient_name}, 'doc_count': 1}
+                                    for hospital_id, patient_name in self.patients],
+                        'after_key': {'hospital_id': self.patients[-1][0], 'patient': self.patients[-1][1]}
+                    }
+            elif 'cardinality' in agg:
+                result[name] = {'value': self.total // 40}
+            elif 'terms' in agg:
+                result[name] = {'buckets': [{'key': '出院记录', 'doc_count': self.total}]}
+        return result
+
+    def stats(self):
+        # 数据固定不变, 输入提示只需要构建一次
+        return {'indices': {'medical_records': {'uuid': 'fake-uuid', 'primaries': {
+            'docs': {'count': self.total},
+            'indexing': {'index_total': self.total, 'delete_total': 0}
+        }}}}
+
+    def search(self, body):
+        if self.latency:
+            time.sleep(self.latency)
+        size = min(body.get('size', 10), self.hits_per_page)
+        response = {
+            'took': 1,
+            'timed_out': False,
+            'hits': {
+                'total': {'value': self.total, 'relation': 'eq'},
+                'hits': [self._hit(i, body) for i in range(size)]
+            }
+        }
+        if body.get('aggs'):
+            response['aggregations'] = self._aggregations(body['aggs'])
+        return response
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload, status=200):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_GET(self):
+            if self.path.split('?')[0].endswith('/_search'):
+                self._send_json(fake.search(self._read_body()))
+            elif '/_stats' in self.path:
+                self._send_json(fake.stats())
+            else:
+                self._send_json({'name': 'fake-node', 'version': {'distribution': 'opensearch', 'number': '2.18.0'}})
+
+        def do_POST(self):
+            if self.path.split('?')[0].endswith('/_search'):
+                self._send_json(fake.search(self._read_body()))
+            else:
+                self._send_json({'error': 'not supported by fake'}, status=400)
+
+    return Handler
+
+
+def start_server(fake, port=0):
+    """在后台线程中启动, 返回 (server, port)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-opensearch', daemon=True).start()
+    return server, server.server_address[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake OpenSearch server')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--hits', type=int, default=10, help='每页最多返回的命中数')
+    parser.add_argument('--text-size', type=int, default=500, help='每页内容的字符数')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    fake = FakeOpenSearch(make_patients(args.patients, args.seed), args.hits, args.text_size, latency_ms=args.latency_ms)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(fake))
+    print(f'Fake OpenSearch listening on http://127.0.0.1:{args.port}')
+    server.serve_forever()
@@ -0,0 +1,72 @@
+# fake_webdav.py
+"""只支持 GET 的 WebDAV 替身, 返回合成 PDF, 可以注入延迟和错误"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_data import make_pdf
+
+
+class FakeWebDav:
+    def __init__(self, pdf_size=200 * 1024, latency_ms=0, jitter_ms=0, error_rate=0.0, seed=42):
+        self.pdf = make_pdf(pdf_size)
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_delay_and_error(self):
+        with self._lock:
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self._rng.random() < self.error_rate
+        return delay, failed
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            delay, failed = fake.next_delay_and_error()
+            if delay:
+                time.sleep(delay)
+            if failed:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', str(len(fake.pdf)))
+            self.end_headers()
+            self.wfile.write(fake.pdf)
+
+    return Handler
+
+
+def start_server(fake, port=0):
+    """在后台线程中启动, 返回 (server, port)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-webdav', daemon=True).start()
+    return server, server.server_address[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake WebDAV server')
+    parser.add_argument('--port', type=int, default=1900)
+    parser.add_argument('--pdf-size', type=int, default=200 * 1024, help='PDF 大小(字节)')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeWebDav(args.pdf_size, args.latency_ms, args.jitter_ms, args.error_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(fake))
+    print(f'Fake WebDAV listening on http://127.0.0.1:{args.port}')
+    server.serve_forever()
@@ -0,0 +1,127 @@
+# loadgen.py
+"""固定并发的压测: 统计吞吐量、延迟分位数和被测进程的峰值内存"""
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+
+import requests
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f'/proc/{parent}/task'):
+                with open(f'/proc/{parent}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def read_rss_kb(pid):
+    """进程及其子进程(gunicorn worker)的常驻内存之和, 单位 KB"""
+    total = 0
+    for process in _process_tree(pid):
+        try:
+            with open(f'/proc/{process}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """后台定时采样 RSS, 记录峰值"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, read_rss_kb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, read_rss_kb(self.pid))
+
+
+def run_load(urls, duration, concurrency, pid=None, timeout=30):
+    """用 concurrency 个线程轮流请求 urls, 持续 duration 秒"""
+    url_cycle = itertools.cycle(urls)
+    cycle_lock = threading.Lock()
+    latencies = []
+    statuses = Counter()
+    result_lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        local_latencies = []
+        local_statuses = Counter()
+        while time.monotonic() < deadline:
+            with cycle_lock:
+                url = next(url_cycle)
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout=timeout)
+                response.content
+                local_statuses[response.status_code] += 1
+            except requests.RequestException as e:
+                local_statuses[type(e).__name__] += 1
+            local_latencies.append(time.perf_counter() - start)
+        with result_lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=worker, name=f'loadgen-{i}') for i in range(concurrency)]
+    started = time.monotonic()
+    sampler = RssSampler(pid) if pid else None
+    if sampler:
+        sampler.__enter__()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if sampler:
+            sampler.__exit__(None, None, None)
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        'requests': len(latencies),
+        'ok': ok,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': to_ms(percentile(latencies, 50)),
+        'p95_ms': to_ms(percentile(latencies, 95)),
+        'p99_ms': to_ms(percentile(latencies, 99)),
+        'max_ms': to_ms(latencies[-1] if latencies else None),
+        'peak_rss_mb': round(sampler.peak_kb / 1024, 1) if sampler else None
+    }
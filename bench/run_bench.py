@@ -0,0 +1,204 @@
+# run_bench.py
+"""本机离线压测: 启动 OpenSearch/WebDAV 替身和脱敏数据库, 运行 app 并逐个压测接口
+
+    python bench/run_bench.py --duration 10 --concurrency 8
+    python bench/run_bench.py --compare bench/results/bench_20250101_120000.json
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import requests
+
+import fake_opensearch
+import fake_webdav
+from bench_data import make_patients, seed_desens_db
+from loadgen import run_load
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'bench', 'results')
+ENDPOINTS = ('search', 'search_grouped', 'suggest', 'pdf')
+
+
+def write_settings(workdir, opensearch_port, webdav_port):
+    settings = {
+        'opensearch': {
+            'host': f'http://127.0.0.1:{opensearch_port}',
+            'user': 'bench',
+            'password': 'bench',
+            'index_name': 'medical_records'
+        },
+        'webdav': {
+            'ip': '127.0.0.1',
+            'port': webdav_port,
+            'user': 'bench',
+            'password': 'bench',
+            'directory': '/medical_records',
+            'enabled': True
+        },
+        'localfile': {
+            'pdf_directory': os.path.join(workdir, 'pdf_files'),
+            'index_enabled': False
+        },
+        # 压测从同一个 IP 发起, 放开限速, 只保留并发上限
+        'admission': {
+            'rate_per_client': 1000000,
+            'burst_per_client': 1000000
+        },
+        'suggest': {
+            'refresh_interval': 3600
+        }
+    }
+    with open(os.path.join(workdir, 'settings.json'), 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=4, ensure_ascii=False)
+
+
+def start_app(workdir, port, server, workers):
+    env = dict(os.environ, OPENSEARCH_STARTUP_WAIT='0')
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--pythonpath', REPO_DIR, '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--threads', '8', 'app:app']
+    else:
+        launcher = (f'import sys; sys.path.insert(0, {REPO_DIR!r}); import app; '
+                    f'app.app.run(host="127.0.0.1", port={port}, threaded=True)')
+        command = [sys.executable, '-c', launcher]
+    log = open(os.path.join(workdir, 'app_stdout.log'), 'w')
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    """等待 app 启动并完成输入提示索引的构建"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'app exited with code {process.returncode}, see app_stdout.log in the workdir')
+        try:
+            response = requests.get(f'{base_url}/api/suggest_stats', timeout=1)
+            if response.status_code == 200 and response.json().get('hospital_ids'):
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('app did not become ready in time')
+
+
+def endpoint_urls(base_url, patients):
+    sample = patients[:50]
+    return {
+        'search': [f'{base_url}/api/search?' + urlencode({'query': '发热', 'page': page, 'size': 10})
+                   for page in range(1, 6)],
+        'search_grouped': [f'{base_url}/api/search?' + urlencode({'query': '发热', 'group_by': 'file', 'size': 10})],
+        'suggest': [f'{base_url}/api/suggest?' + urlencode({'field': 'patient', 'prefix': name[:1]})
+                    for _, name in sample] +
+                   [f'{base_url}/api/suggest?' + urlencode({'field': 'hospital_id', 'prefix': hospital_id[:4]})
+                    for hospital_id, _ in sample],
+        'pdf': [f'{base_url}/api/pdf?' + urlencode({'filename': f'{hospital_id}_1.pdf'})
+                for hospital_id, _ in sample]
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    columns = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb')
+    print(f"{'endpoint':<16}" + ''.join(f'{column:>22}' for column in columns))
+    for name, stats in report['endpoints'].items():
+        cells = []
+        for column in columns:
+            value = stats.get(column)
+            old = (baseline or {}).get('endpoints', {}).get(name, {}).get(column)
+            if value is not None and old:
+                cells.append(f'{value} ({(value - old) / old * 100:+.1f}%)')
+            else:
+                cells.append(str(value))
+        print(f'{name:<16}' + ''.join(f'{cell:>22}' for cell in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='fulltxtsearch 离线压测')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--duration', type=float, default=10, help='每个接口压测的秒数')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='flask')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker 数')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--hits', type=int, default=10, help='OpenSearch 替身每页返回的命中数')
+    parser.add_argument('--text-size', type=int, default=500, help='每页内容的字符数')
+    parser.add_argument('--opensearch-latency-ms', type=float, default=0)
+    parser.add_argument('--pdf-size', type=int, default=200 * 1024, help='PDF 大小(字节)')
+    parser.add_argument('--webdav-latency-ms', type=float, default=0)
+    parser.add_argument('--webdav-jitter-ms', type=float, default=0)
+    parser.add_argument('--webdav-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='结果 JSON 路径, 默认为 bench/results/bench_<时间>.json')
+    parser.add_argument('--compare', help='与之前的结果 JSON 对比')
+    parser.add_argument('--keep-workdir', action='store_true')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='fulltxtsearch-bench-')
+    patients = make_patients(args.patients, args.seed)
+    seed_desens_db(os.path.join(workdir, 'data_desens.db'), patients)
+
+    opensearch_server, opensearch_port = fake_opensearch.start_server(fake_opensearch.FakeOpenSearch(
+        patients, args.hits, args.text_size, latency_ms=args.opensearch_latency_ms))
+    webdav_server, webdav_port = fake_webdav.start_server(fake_webdav.FakeWebDav(
+        args.pdf_size, args.webdav_latency_ms, args.webdav_jitter_ms, args.webdav_error_rate, args.seed))
+    write_settings(workdir, opensearch_port, webdav_port)
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    process = start_app(workdir, args.port, args.server, args.workers)
+    try:
+        wait_until_ready(base_url, process)
+        urls = endpoint_urls(base_url, patients)
+        report = {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'config': vars(args),
+            'endpoints': {}
+        }
+        for name in args.endpoints:
+            print(f'Benchmarking {name} for {args.duration}s with concurrency {args.concurrency}...')
+            report['endpoints'][name] = run_load(urls[name], args.duration, args.concurrency, pid=process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        opensearch_server.shutdown()
+        webdav_server.shutdown()
+        if args.keep_workdir:
+            print(f'Workdir kept at {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f'Results saved to {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,83 @@
+import copy
+import fcntl
 import json
 import os
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
 
 logger = logging.getLogger(__name__)
 
+
+def _freeze(value):
+    """把 dict/list 转成只读的 MappingProxyType/tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class SettingsLoadError(RuntimeError):
+    """运行中重新读取 settings.json 失败; 当前设置保持不变"""
+    pass
+
+
+class SettingsSnapshot:
+    """某一版本的只读设置; 读取时不需要加锁或复制"""
+
+    def __init__(self, settings, version):
+        self.version = version
+        self._data = _freeze(settings)
+
+    def __getitem__(self, section):
+        return self._data[section]
+
+    def get(self, section, default=None):
+        return self._data.get(section, default)
+
+    def to_dict(self):
+        """返回可修改的完整副本"""
+        return _thaw(self._data)
+
+
 class SettingsManager:
-    def __init__(self, settings_file_path='./settings.json'):
+    def __init__(self, settings_file_path='./settings.json', check_interval=1.0):
         self.settings_file = settings_file_path
         self.settings = {}
+        # 最多每隔 check_interval 秒检查一次 settings.json 是否被其他进程修改
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._file_signature = None
+        # 最近一次读取失败的文件签名; 文件再次修改之前不再重试
+        self._failed_signature = None
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+        self._subscribers = []
         self.default_settings = {
             "opensearch": {
                 "host": "https://localhost:9200",
                 "user": "admin",
                 "password": "123@QWE#asd", # Use a placeholder default
-                "index_name": "medical_records"
+                "index_name": "medical_records",
+                "route_by_hospital_id": False,
+                "use_ssl": None,
+                "sniff_on_start": False,
+                "sniff_on_connection_fail": False,
+                "sniffer_timeout": 0,
+                "pool_maxsize": 10,
+                "selector": "round_robin",
+                "session_preference": True
             },
             "webdav": {
                 "ip": "",
@@ -21,10 +85,36 @@ class SettingsManager:
                 "user": "",
                 "password": "",
                 "directory": "",
-                "enabled": False
+                "enabled": False,
+                "connect_timeout": 3,
+                "read_timeout": 30,
+                "queue_timeout": 5,
+                "hedge_enabled": False,
+                "breaker_failure_threshold": 5,
+                "breaker_reset_timeout": 30
             },
             "localfile": {
-                "pdf_directory": "pdf_files" # Use a placeholder default
+                "pdf_directory": "pdf_files", # Use a placeholder default
+                "index_enabled": True,
+                "index_refresh_interval": 300
+            },
+            "admission": {
+                "enabled": True,
+                "max_in_flight": 16,
+                "max_queue": 32,
+                "queue_timeout": 2,
+                "rate_per_client": 5,
+                "burst_per_client": 20,
+                "trust_forwarded_for": False,
+                "wildcard_policy": "reject",
+                "min_wildcard_prefix": 2,
+                "max_query_length": 256,
+                "search_timeout": 15
+            },
+            "suggest": {
+                "enabled": True,
+                "refresh_interval": 600,
+                "page_size": 1000
             },
             "others":{
                 "specialpath":False
@@ -33,40 +123,75 @@ class SettingsManager:
         self.load_settings() # Load settings on initialization
 
     def load_settings(self):
-        """Loads all settings from the JSON file."""
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    self.settings = json.load(f)
-                logger.info(f"Settings loaded successfully from {self.settings_file}")
-
-                # Validate and merge with defaults to handle missing keys
-                self._validate_and_merge_defaults(self.settings, self.default_settings)
+        """Loads all settings from the JSON file. 返回是否加载成功"""
+        with self._lock:
+            signature = self._get_file_signature()
+            if not self._load_settings_file():
+                self._failed_signature = signature
+                return False
+            self._file_signature = signature
+            self._failed_signature = None
+            self._publish()
+            return True
 
-                # Specific type handling for webdav_enabled
-                webdav_enabled = self.settings.get('webdav', {}).get('enabled', self.default_settings['webdav']['enabled'])
-                if isinstance(webdav_enabled, str):
-                     self.settings['webdav']['enabled'] = webdav_enabled.lower() == 'true'
-                else:
-                     self.settings['webdav']['enabled'] = bool(webdav_enabled)
+    def _read_settings_file(self):
+        """读取 settings.json 并补全默认值; 文件不存在时返回 None"""
+        if not os.path.exists(self.settings_file):
+            return None
+        with open(self.settings_file, 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        if not isinstance(settings, dict):
+            raise ValueError('top level of settings must be an object')
 
-            except (IOError, json.JSONDecodeError) as e:
-                logger.error(f"Error loading or parsing settings from {self.settings_file}: {e}")
-                self.settings = self.default_settings.copy() # Use default on error
-                logger.info("Using default settings due to load error.")
+        # Validate and merge with defaults to handle missing keys
+        self._validate_and_merge_defaults(settings, self.default_settings)
 
+        # Specific type handling for webdav_enabled
+        webdav_enabled = settings.get('webdav', {}).get('enabled', self.default_settings['webdav']['enabled'])
+        if isinstance(webdav_enabled, str):
+             settings['webdav']['enabled'] = webdav_enabled.lower() == 'true'
         else:
-            self.settings = self.default_settings.copy() # Use default if file doesn't exist
+             settings['webdav']['enabled'] = bool(webdav_enabled)
+        return settings
+
+    def _load_settings_file(self):
+        """读取 settings.json 到 self.settings, 返回是否成功
+
+        只有第一次加载时才在文件不存在或无法解析时使用默认设置; 运行中(例如编辑器正在写入)
+        读取失败时保留当前设置, 否则各 worker 会按默认设置重建客户端, 下一次保存还会把默认设置写回文件.
+        """
+        first_load = self._snapshot is None
+        try:
+            settings = self._read_settings_file()
+        except (IOError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Error loading or parsing settings from {self.settings_file}: {e}")
+            if not first_load:
+                logger.warning(f"Keeping settings version {self._snapshot.version} until {self.settings_file} is fixed.")
+                return False
+            self.settings = copy.deepcopy(self.default_settings) # Use default on error
+            logger.info("Using default settings due to load error.")
+            return True
+
+        if settings is None:
+            if not first_load:
+                logger.error(f"{self.settings_file} disappeared, keeping settings version {self._snapshot.version}.")
+                return False
+            self.settings = copy.deepcopy(self.default_settings) # Use default if file doesn't exist
             logger.info(f"{self.settings_file} not found, using default settings.")
             # Optionally save the default settings structure to the file
             # self.save_settings()
+            return True
+
+        self.settings = settings
+        logger.info(f"Settings loaded successfully from {self.settings_file}")
+        return True
 
 
     def _validate_and_merge_defaults(self, current_dict, default_dict):
         """Recursively merges default values for missing keys."""
         for key, default_value in default_dict.items():
             if key not in current_dict:
-                current_dict[key] = default_value
+                current_dict[key] = copy.deepcopy(default_value)
                 logger.warning(f"Added missing setting '{key}' with default value.")
             elif isinstance(default_value, dict) and isinstance(current_dict[key], dict):
                 # Recurse for nested dictionaries
@@ -76,24 +201,112 @@ class SettingsManager:
 
     def save_settings(self):
         """Saves current settings to the JSON file."""
+        with self._lock, self._file_lock():
+            self._write_settings_file()
+            self._publish()
+
+    def update_settings(self, update):
+        """在文件锁中先读入其他进程保存的修改, 再调用 update(settings) 修改并保存
+
+        重新读取失败时抛出 SettingsLoadError, 不写入文件.
+
+        每个进程只修改自己内存中的设置; 不先重新读取文件的话, 会用旧的内容覆盖其他进程刚保存的修改.
+        """
+        with self._lock, self._file_lock():
+            signature = self._get_file_signature()
+            if signature != self._file_signature:
+                logger.info(f"{self.settings_file} changed by another process, reloading before update.")
+                if not self._load_settings_file():
+                    self._failed_signature = signature
+                    # 不能用当前进程中的旧设置覆盖别人正在修改的文件
+                    raise SettingsLoadError(f"{self.settings_file} cannot be read, settings not saved")
+                self._file_signature = signature
+                self._failed_signature = None
+            result = update(self.settings)
+            self._write_settings_file()
+            self._publish()
+            return result
+
+    @contextmanager
+    def _file_lock(self):
+        # 多个 gunicorn worker 和 manage_index.py 之间的写锁
+        with open(f"{self.settings_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_settings_file(self):
         try:
             # Ensure the webdav_enabled is stored as a boolean before saving
             if 'webdav' in self.settings and 'enabled' in self.settings['webdav']:
                  self.settings['webdav']['enabled'] = bool(self.settings['webdav']['enabled'])
 
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
+            # 先写临时文件再替换, 其他进程不会读到写了一半的文件
+            tmp_file = f"{self.settings_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(self.settings, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_file, self.settings_file)
+            self._file_signature = self._get_file_signature()
             logger.info(f"Settings saved successfully to {self.settings_file}")
-        except IOError as e:
+        except (IOError, OSError) as e:
             logger.error(f"Error saving settings to {self.settings_file}: {e}")
 
+    @property
+    def snapshot(self):
+        """当前版本的只读设置"""
+        return self._snapshot
+
+    def subscribe(self, callback):
+        """设置发生变化时调用 callback(old_snapshot, new_snapshot), 每次变化只调用一次"""
+        self._subscribers.append(callback)
+
+    def _get_file_signature(self):
+        try:
+            stat = os.stat(self.settings_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _publish(self):
+        old = self._snapshot
+        self._snapshot = SettingsSnapshot(self.settings, old.version + 1 if old else 1)
+        if old is None:
+            return
+        for callback in self._subscribers:
+            try:
+                callback(old, self._snapshot)
+            except Exception as e:
+                logger.error(f"Error applying settings version {self._snapshot.version}: {e}", exc_info=True)
+
+    def refresh_if_changed(self):
+        """settings.json 被其他进程(例如另一个 gunicorn worker)修改后重新加载; 返回是否重新加载"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        if self._get_file_signature() in (self._file_signature, self._failed_signature):
+            return False
+        # 已经有线程在重新加载时不等待, 继续使用当前版本
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            signature = self._get_file_signature()
+            if signature in (self._file_signature, self._failed_signature):
+                return False
+            logger.info(f"{self.settings_file} changed, reloading settings.")
+            return self.load_settings()
+        finally:
+            self._lock.release()
+
     def get_all_settings(self):
         """Returns a copy of all settings."""
-        return self.settings.copy()
+        return self._snapshot.to_dict()
 
     def get_webdav_settings(self):
         """Returns a copy of the WebDAV settings section."""
-        return self.settings.get('webdav', {}).copy()
+        return _thaw(self._snapshot.get('webdav', MappingProxyType({})))
 
     def update_webdav_settings(self, webdav_data):
         """Updates the webdav section of the settings and saves."""
@@ -101,9 +314,12 @@ class SettingsManager:
             logger.warning("Invalid data format for updating WebDAV settings.")
             return False # Indicate failure
 
+        return self.update_settings(lambda settings: self._update_webdav_settings(settings, webdav_data))
+
+    def _update_webdav_settings(self, settings, webdav_data):
         # Ensure the webdav section exists
-        if 'webdav' not in self.settings or not isinstance(self.settings['webdav'], dict):
-            self.settings['webdav'] = {}
+        if 'webdav' not in settings or not isinstance(settings['webdav'], dict):
+            settings['webdav'] = {}
             logger.warning("WebDAV section missing in settings, initializing.")
 
         # Update only the keys that are allowed in the default webdav structure
@@ -114,12 +330,9 @@ class SettingsManager:
                   if key == 'enabled':
                        enabled_value = webdav_data[key]
                        if isinstance(enabled_value, str):
-                            self.settings['webdav'][key] = enabled_value.lower() == 'true'
+                            settings['webdav'][key] = enabled_value.lower() == 'true'
                        else:
-                            self.settings['webdav'][key] = bool(enabled_value)
+                            settings['webdav'][key] = bool(enabled_value)
                   else:
-                       self.settings['webdav'][key] = webdav_data[key]
-        
-        # Save the updated settings
-        self.save_settings()
+                       settings['webdav'][key] = webdav_data[key]
         return True # Indicate success
\ No newline at end of file
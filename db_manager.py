@@ -137,4 +137,26 @@ class dataDesensManager:
             logger.error(f"Database error {e}")
         finally:
             if conn:
-                conn.close()
\ No newline at end of file
+                conn.close()
+    def getAllDesensDataDict(self):
+        """一次读取所有住院号的脱敏数据, 返回 {hospital_id: {key: value}}"""
+        conn = None
+        result = {}
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT hospital_id, contexts FROM data_desens")
+            for hospital_id, contexts in cursor:
+                try:
+                    desens_data = json.loads(contexts)
+                except (json.JSONDecodeError, TypeError):
+                    logger.error(f"无法解析 {hospital_id} 的脱敏数据")
+                    continue
+                result[hospital_id] = {key: value for key, value in desens_data.items() if value != '' and key != 'age'}
+            return result
+        except sqlite3.Error as e:
+            logger.error(f"Database error {e}")
+            return result
+        finally:
+            if conn:
+                conn.close()
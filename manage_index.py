@@ -0,0 +1,277 @@
+# manage_index.py
+"""索引生命周期管理
+
+settings.json 中的 opensearch.index_name 作为别名, 实际数据保存在 <别名>_v<版本号> 索引中.
+修改映射时新建一个版本, 按住院号路由重建索引, 再原子地切换别名, 查询不需要停机.
+
+    python manage_index.py status
+    python manage_index.py create
+    python manage_index.py reindex --dest medical_records_v2
+    python manage_index.py swap --index medical_records_v2
+    python manage_index.py migrate            # create + reindex + swap
+    python manage_index.py routing on         # 写入程序也按住院号路由后, 再让查询按住院号路由
+
+切换别名不会自动开启查询路由: 开启后, 没有带 routing=住院号 写入的文档在按住院号查询时会找不到.
+"""
+import argparse
+import logging
+import re
+import sys
+import time
+
+import opensearchpy
+
+from config import SettingsManager
+from search_client import create_opensearch_client
+
+logger = logging.getLogger(__name__)
+
+# 重建时按住院号设置 _routing, 同一患者的所有页落在同一个分片
+ROUTING_SCRIPT = "if (ctx._source['住院号'] != null) { ctx._routing = ctx._source['住院号'].toString(); }"
+
+DATE_FORMAT = "yyyy-MM-dd HH:mm:ss||yyyy-MM-dd||yyyy/MM/dd||strict_date_optional_time||epoch_millis"
+
+
+def _text_with_keyword(eager_global_ordinals=False):
+    """text 字段加 keyword 子字段; 用于聚合的字段预先加载 global ordinals"""
+    keyword = {'type': 'keyword', 'ignore_above': 256}
+    if eager_global_ordinals:
+        keyword['eager_global_ordinals'] = True
+    return {'type': 'text', 'fields': {'keyword': keyword}}
+
+
+def build_index_body(shards, replicas):
+    return {
+        'settings': {
+            'number_of_shards': shards,
+            'number_of_replicas': replicas
+        },
+        'mappings': {
+            'properties': {
+                '患者名': _text_with_keyword(eager_global_ordinals=True),
+                '住院号': _text_with_keyword(eager_global_ordinals=True),
+                '入院时间': {'type': 'date', 'format': DATE_FORMAT, 'ignore_malformed': True},
+                '出院时间': {'type': 'date', 'format': DATE_FORMAT, 'ignore_malformed': True},
+                '文件类型': _text_with_keyword(eager_global_ordinals=True),
+                '文件目录': _text_with_keyword(),
+                '文件名称': _text_with_keyword(),
+                '页号': {'type': 'keyword'},
+                '页内容': {
+                    'type': 'text',
+                    'analyzer': 'ik_max_word',
+                    'search_analyzer': 'ik_smart'
+                }
+            }
+        }
+    }
+
+
+def list_versions(client, alias):
+    """返回 [(版本号, 索引名)], 按版本号排序"""
+    pattern = re.compile(rf'^{re.escape(alias)}_v(\d+)$')
+    try:
+        indices = client.indices.get(index=f'{alias}_v*')
+    except opensearchpy.exceptions.NotFoundError:
+        return []
+    versions = []
+    for name in indices:
+        match = pattern.match(name)
+        if match:
+            versions.append((int(match.group(1)), name))
+    return sorted(versions)
+
+
+def alias_targets(client, alias):
+    """返回别名当前指向的索引列表; 如果 alias 是一个普通索引, 返回 None"""
+    if client.indices.exists_alias(name=alias):
+        return sorted(client.indices.get_alias(name=alias).keys())
+    if client.indices.exists(index=alias):
+        return None
+    return []
+
+
+def create_index(client, alias, shards, replicas, version=None):
+    if version is None:
+        versions = list_versions(client, alias)
+        version = versions[-1][0] + 1 if versions else 1
+    index_name = f'{alias}_v{version}'
+    client.indices.create(index=index_name, body=build_index_body(shards, replicas))
+    logger.info(f"Created index {index_name} ({shards} shards, {replicas} replicas).")
+    return index_name
+
+
+def reindex(client, source, dest, poll_interval=5):
+    """按住院号路由把 source 重建到 dest, 阻塞直到完成"""
+    # 重建期间关闭刷新和副本, 完成后恢复
+    dest_settings = client.indices.get_settings(index=dest)[dest]['settings']['index']
+    replicas = dest_settings.get('number_of_replicas', '1')
+    client.indices.put_settings(index=dest, body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+    try:
+        response = client.reindex(
+            body={
+                'source': {'index': source, 'size': 1000},
+                'dest': {'index': dest},
+                'script': {'lang': 'painless', 'source': ROUTING_SCRIPT}
+            },
+            wait_for_completion=False
+        )
+        task_id = response['task']
+        logger.info(f"Reindexing {source} -> {dest}, task {task_id}")
+        while True:
+            task = client.tasks.get(task_id=task_id)
+            status = task['task']['status']
+            logger.info(f"Reindex progress: {status.get('created', 0) + status.get('updated', 0)}/{status.get('total', 0)}")
+            if task.get('completed'):
+                break
+            time.sleep(poll_interval)
+        failures = task.get('response', {}).get('failures') or []
+        if task.get('error') or failures:
+            raise RuntimeError(f"Reindex failed: {task.get('error') or failures[:5]}")
+    finally:
+        client.indices.put_settings(index=dest, body={'index': {'refresh_interval': None, 'number_of_replicas': replicas}})
+    client.indices.refresh(index=dest)
+    logger.info(f"Reindex {source} -> {dest} completed.")
+
+
+def swap_alias(client, alias, index_name, delete_concrete_index=False):
+    """把别名原子地切换到 index_name"""
+    targets = alias_targets(client, alias)
+    actions = []
+    if targets is None:
+        # 旧版本直接使用了名为 alias 的索引, 必须在同一个请求中删除它才能创建同名别名
+        if not delete_concrete_index:
+            raise RuntimeError(f"'{alias}' is a concrete index. Re-run with --delete-concrete-index "
+                               f"after verifying {index_name} to replace it with an alias.")
+        actions.append({'remove_index': {'index': alias}})
+    else:
+        actions.extend({'remove': {'index': target, 'alias': alias}} for target in targets if target != index_name)
+    actions.append({'add': {'index': index_name, 'alias': alias}})
+    client.indices.update_aliases(body={'actions': actions})
+    logger.info(f"Alias {alias} now points to {index_name}.")
+
+
+def _set_routing(settings_manager, enabled):
+    settings_manager.update_settings(lambda settings: settings['opensearch'].update(route_by_hospital_id=enabled))
+    logger.info(f"Set opensearch.route_by_hospital_id to {enabled} in settings; "
+                f"running workers reload settings.json on their next request.")
+
+
+def _after_swap(settings_manager, args):
+    if args.enable_routing:
+        _set_routing(settings_manager, True)
+    elif not settings_manager.snapshot['opensearch'].get('route_by_hospital_id', False):
+        logger.info("Query routing by 住院号 is still off. Run 'manage_index.py routing on' once every writer "
+                    "indexes documents with routing=住院号.")
+
+
+def _current_source(client, alias):
+    targets = alias_targets(client, alias)
+    if targets is None:
+        return alias
+    if len(targets) != 1:
+        raise RuntimeError(f"Alias {alias} points to {targets}, specify --source explicitly.")
+    return targets[0]
+
+
+def cmd_status(client, alias, args, settings_manager):
+    targets = alias_targets(client, alias)
+    if targets is None:
+        print(f"{alias}: concrete index (not managed by alias yet)")
+    else:
+        print(f"{alias} -> {', '.join(targets) if targets else '(none)'}")
+    for version, name in list_versions(client, alias):
+        count = client.count(index=name)['count']
+        print(f"  v{version}: {name} ({count} docs)")
+    print(f"route_by_hospital_id: {settings_manager.settings['opensearch'].get('route_by_hospital_id', False)}")
+
+
+def cmd_create(client, alias, args, settings_manager):
+    print(create_index(client, alias, args.shards, args.replicas, args.version))
+
+
+def cmd_reindex(client, alias, args, settings_manager):
+    reindex(client, args.source or _current_source(client, alias), args.dest)
+
+
+def cmd_swap(client, alias, args, settings_manager):
+    swap_alias(client, alias, args.index, args.delete_concrete_index)
+    _after_swap(settings_manager, args)
+
+
+def cmd_migrate(client, alias, args, settings_manager):
+    source = args.source or _current_source(client, alias)
+    if source == alias and not args.delete_concrete_index:
+        # 提前检查, 避免重建完成后才发现无法切换
+        raise RuntimeError(f"'{alias}' is a concrete index. Re-run with --delete-concrete-index to replace it with an alias.")
+    dest = create_index(client, alias, args.shards, args.replicas)
+    reindex(client, source, dest)
+    source_count = client.count(index=source)['count']
+    dest_count = client.count(index=dest)['count']
+    if source_count != dest_count:
+        raise RuntimeError(f"Document count mismatch: {source}={source_count}, {dest}={dest_count}. Alias not swapped.")
+    swap_alias(client, alias, dest, args.delete_concrete_index)
+    _after_swap(settings_manager, args)
+
+
+def cmd_routing(client, alias, args, settings_manager):
+    _set_routing(settings_manager, args.state == 'on')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='OpenSearch 索引版本管理')
+    parser.add_argument('--settings', default='./settings.json', help='settings.json 路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('status', help='显示别名和各版本索引')
+
+    create_parser = subparsers.add_parser('create', help='创建新版本索引')
+    create_parser.add_argument('--version', type=int, help='版本号, 默认为最大版本号+1')
+
+    reindex_parser = subparsers.add_parser('reindex', help='按住院号路由重建索引')
+    reindex_parser.add_argument('--source', help='源索引, 默认为别名当前指向的索引')
+    reindex_parser.add_argument('--dest', required=True, help='目标索引')
+
+    swap_parser = subparsers.add_parser('swap', help='原子切换别名')
+    swap_parser.add_argument('--index', required=True, help='别名切换到的索引')
+
+    migrate_parser = subparsers.add_parser('migrate', help='创建新版本, 重建并切换别名')
+    migrate_parser.add_argument('--source', help='源索引, 默认为别名当前指向的索引')
+
+    for sub in (create_parser, migrate_parser):
+        sub.add_argument('--shards', type=int, default=3, help='主分片数')
+        sub.add_argument('--replicas', type=int, default=1, help='副本数')
+    for sub in (swap_parser, migrate_parser):
+        sub.add_argument('--delete-concrete-index', action='store_true',
+                         help='别名同名的旧索引存在时, 在切换别名的同一请求中删除它')
+        sub.add_argument('--enable-routing', action='store_true',
+                         help='切换后让查询按住院号路由; 只有写入程序也以 routing=住院号 写入时才能开启')
+
+    routing_parser = subparsers.add_parser('routing', help='开启或关闭查询按住院号路由')
+    routing_parser.add_argument('state', choices=('on', 'off'))
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    settings_manager = SettingsManager(args.settings)
+    opensearch_config = settings_manager.get_all_settings()['opensearch']
+    client = create_opensearch_client(opensearch_config)
+    alias = opensearch_config.get('index_name', 'medical_records')
+
+    commands = {
+        'status': cmd_status,
+        'create': cmd_create,
+        'reindex': cmd_reindex,
+        'swap': cmd_swap,
+        'migrate': cmd_migrate,
+        'routing': cmd_routing
+    }
+    try:
+        commands[args.command](client, alias, args, settings_manager)
+    except (RuntimeError, opensearchpy.exceptions.OpenSearchException) as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
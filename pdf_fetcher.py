@@ -0,0 +1,211 @@
+# pdf_fetcher.py
+import io
+import os
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态, 且没有可用的本地镜像"""
+    pass
+
+
+class PdfQueueTimeout(Exception):
+    """远端读取在线程池中排队超时, 且没有可用的本地镜像"""
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_count = 0
+
+    def allow_request(self):
+        """是否允许向远端发起请求; 打开超过 reset_timeout 后放行一个探测请求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                logger.info("WebDAV circuit breaker half-open, sending probe request.")
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("WebDAV circuit breaker closed.")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or \
+               (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._open_count += 1
+                logger.warning(f"WebDAV circuit breaker opened after {self._failures} consecutive failures.")
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'open_count': self._open_count,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout
+            }
+
+
+class HedgedPdfReader:
+    """带熔断和本地镜像兜底的 PDF 读取
+
+    远端读取在线程池中执行; 熔断打开、远端失败或排队超过 queue_timeout 时使用本地镜像,
+    开启对冲时, 远端超过 p95 延迟仍未返回则在请求线程中读取本地镜像, 不和远端读取争抢线程池.
+    """
+
+    def __init__(self, breaker=None, max_workers=8, latency_window=200,
+                 hedge_min_delay=0.05, hedge_default_delay=0.5, queue_timeout=5):
+        self.breaker = breaker or CircuitBreaker()
+        self.queue_timeout = queue_timeout
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdf-fetch')
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0,
+            'remote_success': 0,
+            'remote_failures': 0,
+            'breaker_fallbacks': 0,
+            'error_fallbacks': 0,
+            'queue_timeouts': 0,
+            'hedged_requests': 0,
+            'hedge_wins': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def p95_latency(self):
+        """最近成功的远端读取的 p95 延迟(秒), 样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def hedge_delay(self):
+        p95 = self.p95_latency()
+        if p95 is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, p95)
+
+    def _fetch_remote(self, remote_fetch, is_failure):
+        # 结果在任务内部记录, 即使对冲已经由本地返回, 熔断器也能拿到远端的真实结果
+        start = time.monotonic()
+        try:
+            data = remote_fetch()
+        except Exception as e:
+            if is_failure(e):
+                self.breaker.record_failure()
+                self._count('remote_failures')
+            else:
+                self.breaker.record_success()
+            raise
+        elapsed = time.monotonic() - start
+        self.breaker.record_success()
+        with self._lock:
+            self._latencies.append(elapsed)
+            self._counters['remote_success'] += 1
+        return data
+
+    @staticmethod
+    def _read_local(local_path):
+        with open(local_path, 'rb') as f:
+            return io.BytesIO(f.read())
+
+    def _remote_result(self, future, submitted):
+        """等待远端读取的结果; 排队超过 queue_timeout 还没开始的读取直接取消
+
+        连接/读取超时只在线程池开始执行后才计时, 这里限制的是排队的时间.
+        """
+        remaining = submitted + self.queue_timeout - time.monotonic()
+        wait([future], timeout=max(0, remaining))
+        if not future.done() and future.cancel():
+            self._count('queue_timeouts')
+            raise PdfQueueTimeout(f'WebDAV read was queued for more than {self.queue_timeout}s')
+        return future.result()
+
+    def read(self, remote_fetch, local_path=None, hedge=False, is_failure=None):
+        """读取 PDF, 返回 (来源, BytesIO), 来源为 'webdav' 或 'local'
+
+        remote_fetch: 无参函数, 返回远端文件内容的 BytesIO
+        local_path: 本地镜像路径, 没有镜像时为 None
+        is_failure: 判断远端异常是否计入熔断, 默认全部计入
+        """
+        self._count('requests')
+        is_failure = is_failure or (lambda e: True)
+        has_local = local_path is not None and os.path.isfile(local_path)
+
+        if not self.breaker.allow_request():
+            if has_local:
+                self._count('breaker_fallbacks')
+                logger.info(f"WebDAV circuit open, serving local mirror: {local_path}")
+                return 'local', self._read_local(local_path)
+            raise CircuitOpenError('WebDAV circuit breaker is open and no local mirror is available')
+
+        submitted = time.monotonic()
+        remote = self._executor.submit(self._fetch_remote, remote_fetch, is_failure)
+
+        if hedge and has_local:
+            done, _ = wait([remote], timeout=self.hedge_delay())
+            if not done:
+                self._count('hedged_requests')
+                # 本地读取直接在请求线程中执行; 放进线程池会排在变慢的远端读取后面
+                try:
+                    data = self._read_local(local_path)
+                except OSError as e:
+                    logger.warning(f"Hedged local read failed ({e}), waiting for WebDAV: {local_path}")
+                else:
+                    # 还在排队的远端读取不再需要, 已经开始的继续执行以便熔断器拿到结果
+                    remote.cancel()
+                    self._count('hedge_wins')
+                    logger.info(f"Hedged read served from local mirror: {local_path}")
+                    return 'local', data
+
+        try:
+            return 'webdav', self._remote_result(remote, submitted)
+        except Exception as e:
+            if not has_local:
+                raise
+            self._count('error_fallbacks')
+            logger.warning(f"WebDAV read failed ({e}), serving local mirror: {local_path}")
+            return 'local', self._read_local(local_path)
+
+    def get_stats(self):
+        p95 = self.p95_latency()
+        with self._lock:
+            stats = dict(self._counters)
+        stats['breaker'] = self.breaker.get_stats()
+        stats['p95_latency_ms'] = round(p95 * 1000, 1) if p95 is not None else None
+        stats['hedge_delay_ms'] = round(self.hedge_delay() * 1000, 1)
+        stats['queue_timeout'] = self.queue_timeout
+        return stats
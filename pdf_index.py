@@ -0,0 +1,246 @@
+# pdf_index.py
+import sqlite3
+import os
+import fcntl
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+PDF_INDEX_DB_PATH = "./pdf_index.db"
+
+
+class PdfPathIndex:
+    """本地 PDF 目录的 文件名 -> 相对路径 索引
+
+    索引保存在 sqlite 中 (filename 为主键, 不占用进程内存), 按目录 mtime 增量刷新:
+    目录的 mtime 没变说明其中的文件和子目录没有增删, 不需要列目录, 只需按索引中记录的子目录继续 stat.
+    """
+
+    def __init__(self, root_dir, db_path=PDF_INDEX_DB_PATH, max_workers=8):
+        self.root_dir = os.path.realpath(root_dir)
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+        self._create_table()
+
+    def _get_connection(self):
+        """获取数据库连接"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _create_table(self):
+        """创建索引表; 根目录变化时清空旧索引"""
+        conn = None
+        try:
+            conn = self._get_connection()
+            conn.execute("PRAGMA journal_mode=WAL")
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS pdf_files (
+                    filename TEXT PRIMARY KEY,
+                    rel_dir TEXT NOT NULL
+                ) WITHOUT ROWID;
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_pdf_files_dir ON pdf_files (rel_dir)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS pdf_dirs (
+                    rel_dir TEXT PRIMARY KEY,
+                    parent TEXT,
+                    mtime_ns INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_pdf_dirs_parent ON pdf_dirs (parent)")
+            cursor.execute("CREATE TABLE IF NOT EXISTS pdf_index_meta (key TEXT PRIMARY KEY, value TEXT)")
+            cursor.execute("SELECT value FROM pdf_index_meta WHERE key = 'root_dir'")
+            row = cursor.fetchone()
+            if row is None or row[0] != self.root_dir:
+                cursor.execute("DELETE FROM pdf_files")
+                cursor.execute("DELETE FROM pdf_dirs")
+                cursor.execute("INSERT OR REPLACE INTO pdf_index_meta (key, value) VALUES ('root_dir', ?)", (self.root_dir,))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error creating pdf index table: {e}")
+        finally:
+            if conn:
+                conn.close()
+
+    def lookup(self, filename):
+        """返回文件相对根目录的路径, 未收录时返回 None"""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT rel_dir FROM pdf_files WHERE filename = ?", (os.path.basename(filename),))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return os.path.join(row[0], os.path.basename(filename)) if row[0] else os.path.basename(filename)
+        except sqlite3.Error as e:
+            logger.error(f"Database error {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def resolve(self, filename):
+        """返回文件的绝对路径; 未收录、已删除或在根目录之外时返回 None"""
+        rel_path = self.lookup(filename)
+        if rel_path is None:
+            return None
+        # 预防路径遍历攻击
+        file_path = os.path.realpath(os.path.join(self.root_dir, rel_path))
+        if not file_path.startswith(self.root_dir + os.sep) or not os.path.isfile(file_path):
+            return None
+        return file_path
+
+    @staticmethod
+    def _is_pdf(name):
+        return name.lower().endswith('.pdf')
+
+    @staticmethod
+    def _like_subtree(rel_dir):
+        return rel_dir.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+
+    @staticmethod
+    def _join(rel_dir, name):
+        return os.path.join(rel_dir, name) if rel_dir else name
+
+    def _scan_tree(self, rel_root, recursive=True):
+        """扫描一个子树, 返回 (发生变化的目录, rel_root 的子目录)
+
+        变化的目录为 [(rel_dir, parent, mtime_ns, files, subdirs)]; mtime_ns 为 None 表示目录已经不存在,
+        files 为 None 表示目录暂时无法读取, 记下占位记录以便下一次刷新重试.
+        先 stat 目录: mtime 和索引中一致时其中没有增删, 子目录直接从 pdf_dirs 读取, 只有变化的目录才列目录.
+        """
+        changes = []
+        root_subdirs = []
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            stack = [rel_root]
+            while stack:
+                rel_dir = stack.pop()
+                abs_dir = os.path.join(self.root_dir, rel_dir) if rel_dir else self.root_dir
+                parent = os.path.dirname(rel_dir) if rel_dir else None
+                try:
+                    mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except FileNotFoundError:
+                    changes.append((rel_dir, parent, None, None, None))
+                    continue
+                except OSError as e:
+                    logger.warning(f"Cannot stat directory {abs_dir}: {e}")
+                    changes.append((rel_dir, parent, -1, None, None))
+                    continue
+                cursor.execute("SELECT mtime_ns FROM pdf_dirs WHERE rel_dir = ?", (rel_dir,))
+                row = cursor.fetchone()
+                if row is not None and row[0] == mtime_ns:
+                    cursor.execute("SELECT rel_dir FROM pdf_dirs WHERE parent = ?", (rel_dir,))
+                    subdirs = [child for child, in cursor.fetchall()]
+                else:
+                    try:
+                        entries = list(os.scandir(abs_dir))
+                    except OSError as e:
+                        logger.warning(f"Cannot scan directory {abs_dir}: {e}")
+                        changes.append((rel_dir, parent, -1, None, None))
+                        continue
+                    subdirs = [self._join(rel_dir, entry.name) for entry in entries if entry.is_dir(follow_symlinks=False)]
+                    files = [entry.name for entry in entries
+                             if self._is_pdf(entry.name) and entry.is_file(follow_symlinks=False)]
+                    changes.append((rel_dir, parent, mtime_ns, files, subdirs))
+                if rel_dir == rel_root:
+                    root_subdirs = subdirs
+                if recursive:
+                    stack.extend(subdirs)
+        finally:
+            conn.close()
+        return changes, root_subdirs
+
+    def _remove_subtree(self, cursor, rel_dir):
+        like = self._like_subtree(rel_dir)
+        cursor.execute("DELETE FROM pdf_files WHERE rel_dir = ? OR rel_dir LIKE ? ESCAPE '\\'", (rel_dir, like))
+        cursor.execute("DELETE FROM pdf_dirs WHERE rel_dir = ? OR rel_dir LIKE ? ESCAPE '\\'", (rel_dir, like))
+
+    def _apply_changes(self, conn, changes):
+        cursor = conn.cursor()
+        for rel_dir, parent, mtime_ns, files, subdirs in changes:
+            if mtime_ns is None:
+                # 上一次扫描之后被删除的目录
+                self._remove_subtree(cursor, rel_dir)
+                continue
+            if files is None:
+                # mtime 为 -1 的记录不会和任何目录匹配, 下一次刷新会重新列目录; 已有的文件记录保留
+                cursor.execute("INSERT OR IGNORE INTO pdf_dirs (rel_dir, parent, mtime_ns) VALUES (?, ?, -1)",
+                               (rel_dir, parent))
+                continue
+            cursor.execute("DELETE FROM pdf_files WHERE rel_dir = ?", (rel_dir,))
+            cursor.executemany("INSERT OR REPLACE INTO pdf_files (filename, rel_dir) VALUES (?, ?)",
+                               ((name, rel_dir) for name in files))
+            # 删除已经不存在的子目录及其下的所有记录
+            cursor.execute("SELECT rel_dir FROM pdf_dirs WHERE parent = ?", (rel_dir,))
+            removed = {row[0] for row in cursor.fetchall()} - set(subdirs)
+            for removed_dir in removed:
+                self._remove_subtree(cursor, removed_dir)
+            cursor.execute("INSERT OR REPLACE INTO pdf_dirs (rel_dir, parent, mtime_ns) VALUES (?, ?, ?)",
+                           (rel_dir, parent, mtime_ns))
+        conn.commit()
+
+    def refresh(self):
+        """并行扫描根目录并增量更新索引, 返回发生变化的目录数"""
+        if not os.path.isdir(self.root_dir):
+            logger.warning(f"PDF directory {self.root_dir} does not exist, skip indexing.")
+            return 0
+        if not self._refresh_lock.acquire(blocking=False):
+            return 0
+        # 多个 gunicorn worker 共用一个索引库, 同一时间只让一个进程扫描
+        lock_file = open(self.db_path + '.lock', 'w')
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                logger.info("PDF index refresh already running in another process, skip.")
+                return 0
+
+            changed = 0
+            conn = self._get_connection()
+            try:
+                # 根目录本身单独处理, 每个一级子目录交给一个线程
+                root_changes, top_dirs = self._scan_tree('', recursive=False)
+                self._apply_changes(conn, root_changes)
+                changed += len(root_changes)
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf-index') as executor:
+                    futures = [executor.submit(self._scan_tree, rel_dir) for rel_dir in top_dirs]
+                    for future in as_completed(futures):
+                        changes, _ = future.result()
+                        self._apply_changes(conn, changes)
+                        changed += len(changes)
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Error refreshing pdf index: {e}")
+            finally:
+                conn.close()
+            logger.info(f"PDF index refreshed, {changed} directories changed.")
+            return changed
+        finally:
+            lock_file.close()
+            self._refresh_lock.release()
+
+    def start_background_refresh(self, interval=300):
+        """启动后台线程, 立即建立索引并每隔 interval 秒增量刷新"""
+        if self._refresh_thread is not None:
+            return
+
+        def run():
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Unexpected error refreshing pdf index: {e}", exc_info=True)
+                self._stop_event.wait(interval)
+
+        self._refresh_thread = threading.Thread(target=run, name='pdf-index-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        """停止后台刷新线程 (设置变化后重建时调用)"""
+        self._stop_event.set()
@@ -0,0 +1,88 @@
+# search_client.py
+import hashlib
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import opensearchpy
+from opensearchpy.connection_pool import RoundRobinSelector, RandomSelector
+
+SELECTORS = {
+    'round_robin': RoundRobinSelector,
+    'random': RandomSelector
+}
+
+# 记录每个线程最近一次请求发往的节点, 以及各节点处理的请求数
+_request_local = threading.local()
+_node_counts = Counter()
+_node_counts_lock = threading.Lock()
+
+
+class TrackingConnection(opensearchpy.Urllib3HttpConnection):
+    """记录实际处理请求的节点"""
+
+    def perform_request(self, *args, **kwargs):
+        _request_local.node = self.host
+        with _node_counts_lock:
+            _node_counts[self.host] += 1
+        return super().perform_request(*args, **kwargs)
+
+
+def last_served_node():
+    """当前线程最近一次请求发往的节点地址"""
+    return getattr(_request_local, 'node', None)
+
+
+def get_node_stats(client):
+    """连接池中的节点和各节点处理的请求数"""
+    connections = client.transport.connection_pool.connections
+    with _node_counts_lock:
+        requests_per_node = dict(_node_counts)
+    return {
+        'nodes': [connection.host for connection in connections],
+        'requests_per_node': requests_per_node
+    }
+
+
+def normalize_hosts(host_setting):
+    """opensearch.host 可以是单个地址、逗号分隔的地址或地址列表"""
+    if isinstance(host_setting, str):
+        return [host.strip() for host in host_setting.split(',') if host.strip()]
+    return list(host_setting or [])
+
+
+def session_preference(session_key):
+    """同一会话使用固定的 preference, 翻页时命中相同的分片副本和请求缓存"""
+    # preference 不能以 '_' 开头, 否则会被当作特殊取值
+    return 'session-' + hashlib.sha1(session_key.encode('utf-8')).hexdigest()[:16]
+
+
+def create_opensearch_client(opensearch_config, retry_on_timeout=True):
+    """根据 settings.json 中的 opensearch 段创建客户端
+
+    retry_on_timeout 为 False 时超时直接抛出 ConnectionTimeout, 不重试也不把节点标记为不可用;
+    带 request_timeout 的在线搜索应使用这种客户端, 否则一次超时会在占着并发名额时再重试 max_retries 次.
+    """
+    hosts = normalize_hosts(opensearch_config['host'])
+    use_ssl = opensearch_config.get('use_ssl')
+    if use_ssl is None:
+        # 嗅探到的节点地址不带协议, 按配置的第一个地址推断
+        use_ssl = bool(hosts) and urlparse(hosts[0]).scheme == 'https'
+    sniffer_timeout = opensearch_config.get('sniffer_timeout') or None
+    return opensearchpy.OpenSearch(
+        hosts=hosts,
+        http_auth=(opensearch_config['user'], opensearch_config['password']),
+        use_ssl=use_ssl,
+        verify_certs=False, # Consider setting this to True in production with proper CA certs
+        ssl_assert_hostname=False,
+        ssl_show_warn=False, # Set to True in production for warnings
+        connection_class=TrackingConnection,
+        selector_class=SELECTORS.get(opensearch_config.get('selector', 'round_robin'), RoundRobinSelector),
+        pool_maxsize=opensearch_config.get('pool_maxsize', 10),
+        sniff_on_start=opensearch_config.get('sniff_on_start', False),
+        sniff_on_connection_fail=opensearch_config.get('sniff_on_connection_fail', False),
+        sniffer_timeout=sniffer_timeout,
+        timeout=60,  # Increase timeout to 30 seconds
+        max_retries=3,  # Retry failed requests
+        retry_on_timeout=retry_on_timeout
+    )
@@ -0,0 +1,206 @@
+# suggest_index.py
+import bisect
+import os
+import threading
+import time
+import logging
+
+import opensearchpy
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    """排好序的 key 数组, 用 bisect 做前缀查找; 构建后只读, 可以在多线程中共享"""
+
+    def __init__(self, entries=()):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self._keys = [key for key, _ in entries]
+        self._payloads = [payload for _, payload in entries]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def iter_prefix(self, prefix):
+        i = bisect.bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix):
+            yield self._payloads[i]
+            i += 1
+
+    def search(self, prefix, limit=10):
+        results = []
+        for payload in self.iter_prefix(prefix):
+            if len(results) >= limit:
+                break
+            results.append(payload)
+        return results
+
+
+class SuggestionService:
+    """患者名和住院号的输入提示
+
+    后台线程用 composite 聚合分页读取 (住院号, 患者名), 按页限速, 读完后整体替换索引,
+    查询时只读当前索引, 不访问 OpenSearch. 脱敏数据在查询时过滤, 脱敏数据库文件变化后立即重新读取,
+    新登记的患者名不用等到下一次刷新就不会出现在提示中.
+
+    索引中没有写入时间字段, 无法只读取上次刷新之后新增的文档, 所以每次刷新都是全量重建:
+    代价约为 组合数 / page_size 次聚合请求, 以及新旧两份数组同时占用的内存. 刷新前先比较索引的
+    文档数和写入/删除计数, 都没变时跳过重建, 归档数据基本不变时大部分刷新只需要一次 _stats 请求.
+    """
+
+    FIELDS = ('patient', 'hospital_id')
+
+    def __init__(self, client, index_name, desens_manager, mask_value, page_size=1000, page_interval=0.05):
+        self.client = client
+        self.index_name = index_name
+        self.desens_manager = desens_manager
+        self.mask_value = mask_value
+        self.page_size = page_size
+        self.page_interval = page_interval
+        self._indexes = {'patient': PrefixIndex(), 'hospital_id': PrefixIndex()}
+        self._refreshed_at = None
+        self._checked_at = None
+        self._fingerprint = None
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+        self._desens = {}
+        self._desens_signature = None
+        self._desens_lock = threading.Lock()
+
+    def _desens_db_signature(self):
+        signature = []
+        for path in (self.desens_manager.db_path, self.desens_manager.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(signature)
+
+    def _current_desens(self):
+        """所有住院号的脱敏数据; 每次查询只 stat 一次数据库文件, 变化时才重新读取"""
+        signature = self._desens_db_signature()
+        if signature != self._desens_signature:
+            with self._desens_lock:
+                if signature != self._desens_signature:
+                    # 先取签名再读取, 读取过程中数据库又被修改时下一次查询会再读一次
+                    self._desens = self.desens_manager.getAllDesensDataDict()
+                    self._desens_signature = signature
+        return self._desens
+
+    @staticmethod
+    def _is_masked(entry, desens):
+        patient = entry['patient']
+        return bool(patient) and patient in desens.get(entry['hospital_id'], {}).values()
+
+    def suggest(self, field, prefix, limit=10):
+        desens = self._current_desens()
+        results = []
+        for entry in self._indexes[field].iter_prefix(prefix):
+            if len(results) >= limit:
+                break
+            if not self._is_masked(entry, desens):
+                results.append(entry)
+            elif field == 'hospital_id':
+                results.append(dict(entry, patient=self.mask_value(entry['patient'])))
+        return results
+
+    def _iter_pairs(self):
+        """分页读取所有 (住院号, 患者名) 组合"""
+        after_key = None
+        while True:
+            composite = {
+                'size': self.page_size,
+                'sources': [
+                    {'hospital_id': {'terms': {'field': '住院号.keyword'}}},
+                    {'patient': {'terms': {'field': '患者名.keyword', 'missing_bucket': True}}}
+                ]
+            }
+            if after_key:
+                composite['after'] = after_key
+            response = self.client.search(index=self.index_name, body={
+                'size': 0,
+                'aggs': {'pairs': {'composite': composite}}
+            })
+            aggregation = response.get('aggregations', {}).get('pairs', {})
+            for bucket in aggregation.get('buckets', []):
+                yield bucket['key']['hospital_id'], bucket['key']['patient']
+            after_key = aggregation.get('after_key')
+            if not after_key or not aggregation.get('buckets'):
+                return
+            time.sleep(self.page_interval)
+
+    def _index_fingerprint(self):
+        """别名背后各索引的 uuid、文档数和写入/删除计数; 获取失败时返回 None
+
+        分片重启后计数会清零, 这时只会多重建一次, 不会漏掉变化.
+        """
+        try:
+            stats = self.client.indices.stats(index=self.index_name, metric='docs,indexing')
+        except opensearchpy.exceptions.OpenSearchException as e:
+            logger.warning(f"Cannot read stats of {self.index_name}, rebuilding suggestion index: {e}")
+            return None
+        fingerprint = []
+        for name, index_stats in sorted(stats.get('indices', {}).items()):
+            primaries = index_stats.get('primaries', {})
+            indexing = primaries.get('indexing', {})
+            fingerprint.append((name, index_stats.get('uuid'), primaries.get('docs', {}).get('count'),
+                                indexing.get('index_total'), indexing.get('delete_total')))
+        return tuple(fingerprint) or None
+
+    def refresh(self, force=False):
+        """重新构建提示索引, 返回收录的组合数; 索引自上次构建后没有写入时跳过"""
+        fingerprint = self._index_fingerprint()
+        self._checked_at = time.time()
+        if not force and fingerprint is not None and fingerprint == self._fingerprint:
+            logger.info(f"{self.index_name} unchanged since last refresh, suggestion index kept.")
+            return len(self._indexes['hospital_id'])
+        patient_entries = []
+        hospital_entries = []
+        for hospital_id, patient in self._iter_pairs():
+            # 索引中保存原始患者名, 脱敏在 suggest() 中按最新的脱敏数据处理
+            entry = {'patient': patient or '', 'hospital_id': hospital_id}
+            if patient:
+                patient_entries.append((patient, entry))
+            hospital_entries.append((hospital_id, entry))
+        self._indexes = {
+            'patient': PrefixIndex(patient_entries),
+            'hospital_id': PrefixIndex(hospital_entries)
+        }
+        self._refreshed_at = time.time()
+        # 构建前取的指纹; 构建过程中有写入时下一次刷新会再重建
+        self._fingerprint = fingerprint
+        logger.info(f"Suggestion index refreshed: {len(patient_entries)} patients, {len(hospital_entries)} hospital ids.")
+        return len(hospital_entries)
+
+    def start_background_refresh(self, interval=600):
+        """启动后台线程, 立即构建索引并每隔 interval 秒刷新"""
+        if self._refresh_thread is not None:
+            return
+
+        def run():
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh()
+                except opensearchpy.exceptions.OpenSearchException as e:
+                    logger.error(f"Error refreshing suggestion index: {e}")
+                except Exception as e:
+                    logger.error(f"Unexpected error refreshing suggestion index: {e}", exc_info=True)
+                self._stop_event.wait(interval)
+
+        self._refresh_thread = threading.Thread(target=run, name='suggest-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        """停止后台刷新线程 (设置变化后重建时调用)"""
+        self._stop_event.set()
+
+    def get_stats(self):
+        return {
+            'patients': len(self._indexes['patient']),
+            'hospital_ids': len(self._indexes['hospital_id']),
+            'refreshed_at': self._refreshed_at,
+            'checked_at': self._checked_at
+        }
+
@@ -76,13 +76,15 @@ class OperationFailed(WebdavException):
 
 class WebDavClient(object):
     def __init__(self, host, port=0, auth=None, username=None, password=None,
-                 protocol='http', verify_ssl=True, path=None, cert=None):
+                 protocol='http', verify_ssl=True, path=None, cert=None, timeout=None):
         if not port:
             port = 443 if protocol == 'https' else 80
         self.baseurl = '{0}://{1}:{2}'.format(protocol, host, port)
         if path:
             self.baseurl = '{0}/{1}'.format(self.baseurl, path)
         self.cwd = '/'
+        # (connect, read) 或单个数值, 传给 requests; None 表示不限制
+        self.timeout = timeout
         self.session = requests.session()
         self.session.verify = verify_ssl
         self.session.stream = True
@@ -97,9 +99,12 @@ class WebDavClient(object):
 
     def _send(self, method, path, expected_code, **kwargs):
         url = self._get_url(path)
+        kwargs.setdefault('timeout', self.timeout)
         response = self.session.request(method, url, allow_redirects=False, **kwargs)
         if isinstance(expected_code, Number) and response.status_code != expected_code \
             or not isinstance(expected_code, Number) and response.status_code not in expected_code:
+            # stream=True 时不读取的响应要关闭, 连接才会回到会话的连接池
+            response.close()
             raise OperationFailed(method, path, expected_code, response.status_code)
         return response
 